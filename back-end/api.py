@@ -1,19 +1,29 @@
 import atexit
 from functools import wraps
 from flask_cors import CORS, cross_origin
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, Response, stream_with_context
+from flask.json.provider import JSONProvider
+import orjson
 from datetime import datetime
 import json
 import re
-import random
+import secrets
 import string
 import math
 import string
 import hashlib
 import hmac
+import threading
+from collections import deque
+from itertools import product
+from cachetools import TTLCache
 from myjwt import JsonWebToken, is_valid_url  # import self-defined functions
 
 from flask_sqlalchemy import SQLAlchemy
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import sqlite3
 import os
 import sys
 import socket
@@ -46,6 +56,8 @@ REPLICAS = 1  # replica number running on the k8s
 KEY_LENGTH = 2  # 2-digit code as key 
 chars_and_nums = string.digits + string.ascii_lowercase # 0-9, a-z
 DIGIT_LENGTH = len(chars_and_nums)  
+# sizes of the ID space for every key length, computed once
+_POW = [DIGIT_LENGTH ** i for i in range(16)]
 
 
 """
@@ -59,22 +71,137 @@ host_suffix para specify the "rank" of each replica, and all replicas
 def generate_anchor(host_suffix, KEY_LENGTH):
     for i in range(REPLICAS): 
         if host_suffix == str(i):
-            ID_SPACE = pow(DIGIT_LENGTH, KEY_LENGTH) // REPLICAS
+            ID_SPACE = _POW[KEY_LENGTH] // REPLICAS
             key_anchor = ID_SPACE*i - 1 # -1 for the first key
             my_max = key_anchor + ID_SPACE
             return key_anchor, my_max
     return -1, 0
-key_anchor, MAX = generate_anchor(host_suffix, KEY_LENGTH)
 
 
-# active_ids and deleted_ids are used to manage the IDs
-active_ids = set()  
-deleted_ids = set()
+# keys are issued from a pre-generated batch instead of being converted one by one
+KEY_BATCH_SIZE = 1000
+# up to this length all the keys are kept in a table indexed by the anchor (46656 keys for 3 digits)
+KEY_TABLE_MAX_LENGTH = 3
 
-SALT_LENGTH = 5
+# all the keys of the given length in the order of their anchors, None if the table would be too large
+def key_table(key_length):
+    if key_length > KEY_TABLE_MAX_LENGTH:
+        return None
+    return [''.join(digits) for digits in product(chars_and_nums, repeat=key_length)]
+
+# the key of the given anchor
+def encode_key(anchor, key_length):
+    digits = []
+    for _ in range(key_length):
+        anchor, r = divmod(anchor, DIGIT_LENGTH)
+        digits.append(chars_and_nums[r])
+    return ''.join(reversed(digits))
+
+
+"""
+Issues the new keys of this replica's range.
+The key length, the anchor, the end of the range and the batch of keys are only
+changed under the lock, so threads of one worker never issue the same key twice.
+resume() moves the anchor past the keys already in the database, so a restart does
+not issue them again. Worker processes sharing a host_suffix still have separate
+anchors, run a single worker per replica.
+"""
+class KeyAllocator:
+    def __init__(self, host_suffix, key_length):
+        self._lock = threading.Lock()
+        self.host_suffix = host_suffix
+        self.key_length = key_length
+        self.key_anchor, self.max = generate_anchor(host_suffix, key_length)
+        self._keys = key_table(key_length)
+        self._pool = deque()
+
+    """
+    Continue after the highest key of this replica's range that was already issued.
+    find_highest(length, lowest, highest) returns the highest stored key of that length
+    between the two keys, or None. Longer keys were issued later, so they are searched first.
+    """
+    def resume(self, find_highest):
+        with self._lock:
+            for length in range(len(_POW) - 1, self.key_length - 1, -1):
+                anchor, my_max = generate_anchor(self.host_suffix, length)
+                if my_max <= anchor + 1:
+                    continue
+                key = find_highest(length, encode_key(anchor + 1, length), encode_key(my_max - 1, length))
+                if key is not None:
+                    self.key_length = length
+                    self.max = my_max
+                    self.key_anchor = int(key, DIGIT_LENGTH)
+                    self._keys = key_table(length)
+                    self._pool.clear()
+                    return
+
+    def _expand(self):
+        self.key_length += 1
+        self.key_anchor, self.max = generate_anchor(self.host_suffix, self.key_length)
+        self._keys = key_table(self.key_length)
+
+    """
+    Refill the pool of keys with the next batch of the range.
+    The key_anchor is converted to digits once per batch, the following keys
+    are produced by incrementing the digits with carry.
+    """
+    def _refill(self):
+        # digits of the next key, least significant first
+        n = self.key_anchor + 1
+        digits = []
+        for _ in range(self.key_length):
+            n, r = divmod(n, DIGIT_LENGTH)
+            digits.append(r)
+        # the batch never goes past the end of the range
+        for _ in range(min(KEY_BATCH_SIZE, self.max - 1 - self.key_anchor)):
+            self.key_anchor += 1
+            self._pool.append(''.join(chars_and_nums[d] for d in reversed(digits)))
+            i = 0
+            while i < self.key_length:
+                digits[i] += 1
+                if digits[i] < DIGIT_LENGTH:
+                    break
+                digits[i] = 0
+                i += 1
+
+    def next(self):
+        with self._lock:
+            # Expand the digit length of ID if necessary
+            if not self._pool and self.key_anchor >= self.max - 1:
+                self._expand()
+            # short keys are looked up directly
+            if self._keys is not None:
+                self.key_anchor += 1
+                return self._keys[self.key_anchor]
+            if not self._pool:
+                self._refill()
+            return self._pool.popleft()
+
+key_allocator = KeyAllocator(host_suffix, KEY_LENGTH)
+
+SALT_LENGTH = 16
+
+# pagination of GET /
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# cost parameters of scrypt used for password hashing
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
 
 app = Flask(__name__)
 
+# serialize every jsonify() / dict response with orjson instead of the stdlib json
+class ORJSONProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = ORJSONProvider(app)
+
 # https://stackoverflow.com/questions/25594893/how-to-enable-cors-in-flask
 cors = CORS(app)
 app.config['CORS_HEADERS'] = 'Content-Type'
@@ -92,12 +219,55 @@ db_name = 'data.db'
 app.config['SQLALCHEMY_DATABASE_URI'] = config_starts + os.path.join(app.root_path, db_name)      # /// for windows, or ////
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'OurGroupNumberIs16'  
+# keep the compiled statements of our few queries cached, check pooled connections before use
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'query_cache_size': 1200, 'pool_pre_ping': True}
+# journal mode of data.db, DELETE by default since data.db is shared over NFS where WAL is unsafe
+# set SQLITE_JOURNAL_MODE=WAL only when the database is on a local disk (the mode persists in the file)
+SQLITE_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'WAL')
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'DELETE').upper()
+if SQLITE_JOURNAL_MODE not in SQLITE_JOURNAL_MODES:
+    raise ValueError(f"SQLITE_JOURNAL_MODE must be one of {', '.join(SQLITE_JOURNAL_MODES)}")
+# site-wide pepper mixed into every password hash, it must come from the environment to stay secret
+# the fallback to SECRET_KEY is only for development: that key is in this public source
+# changing the pepper later invalidates every password hashed with the old one
+PEPPER = os.environ.get('PEPPER')
+if not PEPPER:
+    print("WARNING: PEPPER is not set, password hashes use the public SECRET_KEY as pepper", file=sys.stderr)
+    PEPPER = app.config['SECRET_KEY']
+PEPPER = PEPPER.encode()
+# keyed HMAC state, copied per call instead of re-keying
+_PEPPER_HMAC = hmac.new(PEPPER, digestmod=hashlib.sha256)
 
 
 db = SQLAlchemy(app)
 
+# tune every new SQLite connection
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}')  # whitelisted above
+    # NORMAL is only corruption-safe with WAL, the rollback journal keeps the default FULL
+    if SQLITE_JOURNAL_MODE == 'WAL':
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
 jwt_api = JsonWebToken()
 
+# cache of verified tokens: sha256(token) -> decoded username
+# repeated requests with the same token skip the HMAC check and the payload decoding
+# our tokens carry no expiry, so the TTL alone bounds how long an entry is trusted
+TOKEN_CACHE_TTL = 30
+_token_cache = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL)
+_token_cache_lock = threading.Lock()    # TTLCache itself is not thread-safe
+
+# cache of successful password checks, see check_password()
+PASSWORD_CACHE_TTL = 60
+_password_cache = TTLCache(maxsize=10000, ttl=PASSWORD_CACHE_TTL)
+_password_cache_lock = threading.Lock()
+
 
 # create database model
 class User(db.Model):
@@ -106,24 +276,109 @@ class User(db.Model):
     username = db.Column(db.String, primary_key = True)
     email = db.Column(db.String)
     salt = db.Column(db.String)
-    password = db.Column(db.String)
+    password = db.Column(db.LargeBinary(32))   # raw scrypt digest
+    # lazy loading raises: load the related rows explicitly, e.g. with selectinload(User.urls)
+    urls = db.relationship('Url', lazy='raise', back_populates='user')
 
 class Url(db.Model):
     __tablename__ = 'url'
     id = db.Column(db.Integer, primary_key=True)
-    urlid = db.Column(db.String)
+    urlid = db.Column(db.String, index=True)
     text = db.Column(db.String)
-    username = db.Column(db.String, db.ForeignKey('user.username'))
-
-# generate the random salt
+    username = db.Column(db.String, db.ForeignKey('user.username'), index=True)
+    user = db.relationship('User', lazy='raise', back_populates='urls')
+
+# deleted IDs waiting to be issued again, kept in the database so they survive restarts
+class Recycled(db.Model):
+    __tablename__ = 'recycled_id'
+    urlid = db.Column(db.String, primary_key=True)
+
+# schemas of the request bodies, the raw body is parsed and validated in one call
+class CredentialsIn(BaseModel):
+    username: str
+    password: str
+
+class PasswordUpdateIn(BaseModel):
+    username: str = Field(min_length=1)
+    password: str = Field(min_length=1)
+    new_password: str = Field(min_length=1)
+
+class UrlIn(BaseModel):
+    value: str
+
+# the highest key of the given length between lowest and highest, among the issued and the recycled IDs
+def find_highest_key(length, lowest, highest):
+    keys = [
+        db.session.execute(
+            db.select(db.func.max(column)).where(db.func.length(column) == length, column.between(lowest, highest))
+        ).scalar()
+        for column in (Url.urlid, Recycled.urlid)
+    ]
+    keys = [key for key in keys if key is not None]
+    return max(keys) if keys else None
+
+# create the tables missing from data.db
+# create_all() skips the tables that already exist, so their new indexes are created one by one
+with app.app_context():
+    db.create_all()
+    for ix in Url.__table__.indexes:
+        ix.create(db.engine, checkfirst=True)
+    key_allocator.resume(find_highest_key)
+
+# generate the random salt from the OS CSPRNG
 def random_salt():
-    return ''.join(random.choice(chars_and_nums) for i in range(SALT_LENGTH))
+    return secrets.token_urlsafe(SALT_LENGTH)[:SALT_LENGTH]
 
-# hash the password with the salt
+# hash the password with the salt, return the raw 32-byte digest
+# scrypt is deliberately slow, tune the cost to the deployment (memory used: 128 * r * n bytes)
 def hash_password(salt, pwd):
-    salted_pwd = pwd + salt
-    hashed_pwd = hashlib.sha256(salted_pwd.encode())
-    return hashed_pwd.hexdigest()
+    peppered_pwd = _PEPPER_HMAC.copy()
+    peppered_pwd.update(pwd.encode())
+    hashed_pwd = hashlib.scrypt(peppered_pwd.digest(), salt=salt.encode(),
+                                n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+    return hashed_pwd
+
+# pay the scrypt cost for an unknown username or an unusable stored hash as well,
+# so the response time does not tell which usernames exist
+_DUMMY_SALT = '0' * SALT_LENGTH
+_DUMMY_HASH = bytes(32)
+
+def check_dummy_password(pwd):
+    hmac.compare_digest(hash_password(_DUMMY_SALT, pwd), _DUMMY_HASH)
+    return False
+
+# check the password of the given user
+# recent successful checks are remembered so that repeated logins skip the KDF,
+# the stored hash is part of the key so changing the password invalidates the entry
+def check_password(user, pwd):
+    if isinstance(user.password, str):
+        return _check_legacy_password(user, pwd)
+    # anything but a raw 32-byte digest cannot match, reject it before hashing
+    if not isinstance(user.password, bytes) or len(user.password) != 32:
+        return check_dummy_password(pwd)
+    cache_key = _PEPPER_HMAC.copy()
+    cache_key.update(user.password)     # fixed length, so the fields cannot run into each other
+    cache_key.update('\0'.join((user.username, pwd)).encode())
+    cache_key = cache_key.digest()
+    with _password_cache_lock:
+        if cache_key in _password_cache:
+            return True
+    if not hmac.compare_digest(hash_password(user.salt, pwd), user.password):    # compares bytes
+        return False
+    with _password_cache_lock:
+        _password_cache[cache_key] = True
+    return True
+
+# accounts created before scrypt store sha256(pwd + salt) as a hex string,
+# they are checked the old way and re-hashed with scrypt after the first successful check
+def _check_legacy_password(user, pwd):
+    legacy_hash = hashlib.sha256((pwd + user.salt).encode()).hexdigest()
+    if not hmac.compare_digest(legacy_hash.encode(), user.password.encode()):
+        return check_dummy_password(pwd)
+    user.salt = random_salt()
+    user.password = hash_password(user.salt, pwd)
+    db.session.commit()
+    return True
 
 # decorator for authenticating the token
 def token_required(f):
@@ -136,58 +391,70 @@ def token_required(f):
             return jsonify({'message': 'Token is missing!'}), 403
         
         try:
-            token_type, token = auth_header.split(' ')
-            if token_type.lower() != 'bearer':
+            # a single scan of the header, no list is built
+            token_type, _, token = auth_header.partition(' ')
+            if token_type.casefold() != 'bearer':
                 raise ValueError("Authorization header must start with Bearer")
-            # compare the old signature with the newly generated one
-            if not jwt_api.verify_jwt(token):
-                raise ValueError("Invalid token or token has expired")
+            token_key = hashlib.sha256(token.encode()).digest()
+            with _token_cache_lock:
+                current_user = _token_cache.get(token_key)
+            if current_user is None:
+                # compare the old signature with the newly generated one
+                if not jwt_api.verify_jwt(token):
+                    raise ValueError("Invalid token or token has expired")
+                # decode the payload of the token
+                current_user = jwt_api.decode_jwt(token)
+                with _token_cache_lock:
+                    _token_cache[token_key] = current_user
         except Exception as e:
             print("exception,",e)
             return jsonify({'message': str(e)}), 403
 
-        # decode the payload of the token
-        current_user = jwt_api.decode_jwt(token)
-        # let POST and PUT receive the current_user
-        if request.method == 'POST' or request.method == 'PUT' or request.method == 'DELETE':
-            return f(current_user, *args, **kwargs)
-        return f( *args, **kwargs)
+        # let the view receive the current_user
+        return f(current_user, *args, **kwargs)
     
     return decorated_function
 
 
+"""
+Take a deleted ID out of the [recycled_id] table, return None if there is none.
+The row is locked where the database supports it, and the DELETE must hit it,
+otherwise another worker took the same ID first and we try the next one.
+The caller commits, so claiming the ID and storing its URL share one transaction.
+"""
+def _pop_recycled():
+    while True:
+        key = db.session.execute(
+            db.select(Recycled.urlid).limit(1).with_for_update(skip_locked=True)
+        ).scalar()
+        if key is None:
+            return None
+        if db.session.execute(db.delete(Recycled).where(Recycled.urlid == key)).rowcount:
+            return key
+
 """
 Generating IDs:
 Starts from 2-digit code as key: _ _, one digit varys from 0 to 9 and a to z.
 If the length of key cannot satisfy to represent the number of URLs, the digit length of key will expand.
-Deleted ID will be recycled by adding into the [deleted_ids]
+Deleted ID will be recycled through the [recycled_id] table
 """
 def generate_key():
-    global key_anchor, KEY_LENGTH, MAX
-    if deleted_ids:
-        # First will try to reuse recycled IDs
-        key = deleted_ids.pop()
-    else:
-        # Expand the digit length of ID if necessary
-        if key_anchor >= MAX - 1:
-            KEY_LENGTH += 1
-            key_anchor, MAX = generate_anchor(host_suffix, KEY_LENGTH)
-        # refresh the key_anchor for the next key
-        key_anchor += 1
-        # Convert the key_anchor to the key
-        key_indices = [(key_anchor // pow(DIGIT_LENGTH, i)) % DIGIT_LENGTH for i in range(KEY_LENGTH - 1, -1, -1)]
-        key = ''.join(chars_and_nums[k] for k in key_indices)
-    active_ids.add(key)  
+    # First will try to reuse recycled IDs
+    key = _pop_recycled()
+    if key is None:
+        key = key_allocator.next()
     return key
 
 """
 Recycle of deleted IDs:
-Delete the ID from [activat_ids] and put it into the [deleted_ids]
+Delete the user's URL of the ID and put the ID into the [recycled_id] table in one transaction.
+The ID is only recycled once no other user's URL holds it.
 """
-def delete_id(del_id):
-    if del_id in active_ids:
-        active_ids.remove(del_id)
-        deleted_ids.add(del_id)
+def delete_id(del_id, user):
+    if db.session.execute(db.delete(Url).where(Url.urlid == del_id, Url.username == user)).rowcount:
+        if db.session.execute(db.select(Url.id).where(Url.urlid == del_id).limit(1)).first() is None:
+            db.session.merge(Recycled(urlid=del_id))
+        db.session.commit()
     else:
         print(f"ID '{del_id}' not found.")
 
@@ -199,18 +466,18 @@ return (JWT, 200) if both are correct
 """
 @app.route('/users/login', methods=['POST'])
 def login():
-    data = request.get_json()
-    if 'username' in data and 'password' in data:
-        res = User.query.filter_by(username=data['username']).all()
-        if len(res) == 1:
-            res = res[0]
-            if hmac.compare_digest(hash_password(res.salt, data['password']), res.password):    # compare hashed password
-                # generate token
-                jwt = jwt_api.generate_jwt(data['username'])  # add the username for verification
-                return jsonify(jwt), 200 
-            return jsonify({"detail":"forbidden"}), 403 
-    else:
+    try:
+        data = CredentialsIn.model_validate_json(request.get_data())
+    except ValidationError:
         return jsonify({"detail":"forbidden"}), 403
+    res = db.session.get(User, data.username)    # primary key lookup
+    if res is None:
+        check_dummy_password(data.password)
+    elif check_password(res, data.password):    # compare hashed password
+        # generate token
+        jwt = jwt_api.generate_jwt(data.username)  # add the username for verification
+        return jsonify(jwt), 200 
+    return jsonify({"detail":"forbidden"}), 403
 
 """
 Create an account with POSTed username and password
@@ -221,30 +488,40 @@ Return (201) if successfully created
 @app.route('/users', methods=['POST'])
 def users_post():
     #data = request.form
-    data = request.get_json()
-    if 'username' in data and 'password' in data:
-        # res = db.session.execute(db.select(User).filter_by(username=data['username'])).first()
-        res = User.query.filter_by(username=data['username']).first()
-        if res:
-            return jsonify({"detail":"duplicate"}), 409  #make_response(jsonify('duplicate', 409))
-        else: 
-            # idea: generate a random salt for each user to encrypt the password in case of an attack
-            user_salt = random_salt()
-            new_user = User(username=data['username'], password=hash_password(user_salt, data['password']), salt=user_salt)
-            db.session.add(new_user)
-            db.session.commit()
-            return jsonify(data['username']), 201
-    else:
+    try:
+        data = CredentialsIn.model_validate_json(request.get_data())
+    except ValidationError:
         return jsonify({"detail":"username or password not given"}), 404 
+    # res = db.session.execute(db.select(User).filter_by(username=data['username'])).first()
+    res = db.session.get(User, data.username)
+    if res:
+        return jsonify({"detail":"duplicate"}), 409  #make_response(jsonify('duplicate', 409))
+    # idea: generate a random salt for each user to encrypt the password in case of an attack
+    user_salt = random_salt()
+    new_user = User(username=data.username, password=hash_password(user_salt, data.password), salt=user_salt)
+    db.session.add(new_user)
+    db.session.commit()
+    return jsonify(data.username), 201
 
 """
 Get all the users
+The list is streamed while the rows are fetched 500 at a time, it is never built in memory
 """    
 @app.route('/users', methods=['GET'])
 def users_get():
-    users = User.query.all()
-    users_data = [{'username': user.username, 'email': user.email} for user in users]
-    return jsonify(users_data)
+    def generate():
+        rows = db.session.execute(
+            db.select(User.username, User.email).execution_options(yield_per=500)
+        )
+        yield '['
+        first = True
+        for username, email in rows:
+            if not first:
+                yield ','
+            first = False
+            yield app.json.dumps({'username': username, 'email': email})
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 """
 Update the password of the given username using PUT method
@@ -255,24 +532,23 @@ Return (200) if successfully updated
 """
 @app.route('/users', methods=['PUT'])
 def users_put():
-    data = request.get_json()
-    username = data.get('username')
-    old_password = data.get('password')
-    new_password = data.get('new_password')
-    
-    if not username or not new_password or not old_password:
+    try:
+        data = PasswordUpdateIn.model_validate_json(request.get_data())
+    except ValidationError:
         # the username or password is not given
         return jsonify({"detail":"Missing username or password"}), 400
 
-    user = User.query.filter_by(username=username).first()
+    user = db.session.get(User, data.username)
     if user:
-        if not hmac.compare_digest(user.password, hash_password(user.salt, old_password)):
+        if not check_password(user, data.password):
             return jsonify({'detail': 'forbidden'}), 403
-        user.password = new_password
+        user.salt = random_salt()
+        user.password = hash_password(user.salt, data.new_password)
         db.session.commit()
         return jsonify(user.username), 200
     else:
         # user does not exist
+        check_dummy_password(data.password)
         return jsonify({"detail":"Username does not exist"}), 404
 
 
@@ -287,8 +563,10 @@ POST method:
 @app.route('/', methods=['POST'])
 @token_required
 def post_by_url(user):
-    data = request.get_json()
-    url = str(data.get('value'))
+    try:
+        url = UrlIn.model_validate_json(request.get_data()).value
+    except ValidationError:
+        return make_response({'error': 'Invalid URL'}, 400)
     if not is_valid_url(url):
         return make_response({'error': 'Invalid URL'}, 400)
     identifier = generate_key()  # use generate_key() to get ID
@@ -296,18 +574,27 @@ def post_by_url(user):
     # MOD here
     new_url = Url(text=url, urlid=identifier, username=user)
     db.session.add(new_url)
+    # one commit per POST, it also covers the removal of a recycled ID
+    # the ID is returned to the client, so the row must be durable before answering and is not buffered;
+    # under the default DELETE journal (synchronous=FULL) every commit still syncs the journal and data.db,
+    # only SQLITE_JOURNAL_MODE=WAL turns it into a cheaper append to the WAL
     db.session.commit()
     return make_response(jsonify(id=identifier, username=user), 201)
 
 """
 GET method:
-1. Get all the keys from the database
+1. Get one page of the user's keys from the database, ?limit=&offset= select the page
 2. Serialize the list
 3. Return the list of keys and the status code
 """
 @app.route('/', methods=['GET'])
 @token_required
-def get_all_keys():
-   all_urls = Url.query.all()
-   new_res = {url.urlid : url.text for url in all_urls }
+def get_all_keys(user):
+   limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 0), MAX_PAGE_SIZE)
+   offset = max(request.args.get('offset', 0, type=int), 0)
+   # select the two columns only, no Url objects are built
+   rows = db.session.execute(
+       db.select(Url.urlid, Url.text).where(Url.username == user).order_by(Url.id).limit(limit).offset(offset)
+   ).all()
+   new_res = dict(rows)
    return make_response(new_res, 200)
@@ -4,6 +4,7 @@ import secrets
 import hmac
 import hashlib
 import re
+from functools import lru_cache
 
 # https://docs.python.org/3/library/base64.html
 # https://docs.python.org/3/library/json.html
@@ -151,18 +152,29 @@ class JsonWebToken:
 
 """
 Check if the URL is valid
+The pattern is compiled once, and recent results are cached since clients often post the same URL again.
+URLs longer than URL_MAX_LENGTH are rejected before the cache, so it only ever holds short strings.
 """
+URL_MAX_LENGTH = 2048
+
+URL_REGEX = re.compile(
+    r'^(?:http)s?://'  # http or https
+    r'(?:'  # IP address or domain name
+    r'(?:[0-9]{1,3}\.){3}[0-9]{1,3}'  # IPv4 address
+    r'|'  # OR
+    r'localhost'  # localhost
+    r'|'  # OR
+    r'(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+'  # 
+    r'(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)'  # top domain
+    r')'
+    r'(?::[0-9]+)?'  # port number(optional)
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)  # path
+
 def is_valid_url(url):
-    regex = re.compile(
-        r'^(?:http)s?://'  # http or https
-        r'(?:'  # IP address or domain name
-        r'(?:[0-9]{1,3}\.){3}[0-9]{1,3}'  # IPv4 address
-        r'|'  # OR
-        r'localhost'  # localhost
-        r'|'  # OR
-        r'(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+'  # 
-        r'(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)'  # top domain
-        r')'
-        r'(?::[0-9]+)?'  # port number(optional)
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE)  # path
-    return re.match(regex, url)
\ No newline at end of file
+    if len(url) > URL_MAX_LENGTH:
+        return False
+    return _match_url(url)
+
+@lru_cache(maxsize=4096)
+def _match_url(url):
+    return URL_REGEX.match(url) is not None
\ No newline at end of file